@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark of hash_passwords: hashes per second against the number of
+worker processes, next to a serial hash_password loop
+"""
+
+import argparse
+import os
+import time
+from typing import Callable, List
+
+from filtered_logger import (bcrypt_rounds, calibrate_bcrypt_rounds,
+                             hash_password, hash_passwords)
+
+
+def worker_counts(cores: int) -> List[int]:
+    """
+    Returns 1, 2, 4, ... up to `cores`, always ending with `cores`
+    """
+
+    counts = []
+    count = 1
+    while count < cores:
+        counts.append(count)
+        count *= 2
+    counts.append(cores)
+    return counts
+
+
+def rate(run: Callable[[], None], count: int) -> float:
+    """
+    Returns how many hashes per second `run` computes, for `count` hashes
+    """
+
+    start = time.perf_counter()
+    run()
+    return count / (time.perf_counter() - start)
+
+
+def main() -> None:
+    """
+    Prints the hash rate of a serial loop, then of hash_passwords for
+    each worker count, with the speedup over the serial loop
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=64,
+                        help="passwords hashed per measurement")
+    parser.add_argument('--rounds', type=int, default=None,
+                        help="bcrypt work factor, calibrated by default")
+    parser.add_argument('--workers', type=int, nargs='*', default=None,
+                        help="worker counts to try, 1 2 4 ... cores by "
+                             "default")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.rounds is not None:
+        calibrate_bcrypt_rounds(min_rounds=args.rounds,
+                                max_rounds=args.rounds)
+    rounds = bcrypt_rounds()
+    passwords = ['password{}'.format(i) for i in range(args.count)]
+    print("cores: {}, rounds: {}, passwords: {}".format(
+        cores, rounds, args.count))
+
+    serial = rate(lambda: [hash_password(password, rounds)
+                           for password in passwords], args.count)
+    print("serial     {:8.1f} hashes/s".format(serial))
+    for workers in args.workers or worker_counts(cores):
+        parallel = rate(lambda: list(hash_passwords(passwords, workers)),
+                        args.count)
+        print("workers={:<3d}{:8.1f} hashes/s  x{:.2f}".format(
+            workers, parallel, parallel / serial))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,19 +4,91 @@ This module contains a method that returns the log message obfuscated
 """
 
 import re
+import atexit
 import logging
 import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
+from typing import (Callable, FrozenSet, Iterable, Iterator, List, Pattern,
+                    Tuple)
 import bcrypt
 import mysql.connector
+import mysql.connector.pooling
 
 
-def filter_datum(fields, redaction, message, separator):
+@lru_cache(maxsize=128)
+def _redaction_pattern(fields: Tuple[str, ...], separator: str) -> Pattern:
+    """
+    Compiles the regex matching `field=value` pairs for `fields`, once per
+    (fields, separator) pair. A field only matches as a whole key, at the
+    start of the message or right after whitespace or `separator`.
+    """
+
+    sep = re.escape(separator)
+    return re.compile(r'(?<![^\s{}])({})=[^{}]*'.format(
+        sep, '|'.join(map(re.escape, fields)), sep))
+
+
+def _redaction_template(redaction: str) -> str:
+    """
+    Returns the `re.sub` replacement keeping the field name and
+    swapping its value for `redaction`
+    """
+
+    return r'\g<1>=' + redaction.replace('\\', r'\\')
+
+
+def filter_datum(fields: List[str], redaction: str,
+                 message: str, separator: str) -> str:
     """
     Returns the log message obfuscated
     """
 
-    regex = '|'.join(fields)
-    return re.sub(regex, redaction, message)
+    pattern = _redaction_pattern(tuple(fields), separator)
+    return pattern.sub(_redaction_template(redaction), message)
+
+
+def redact_many(fields: List[str], redaction: str,
+                messages: Iterable[str], separator: str) -> List[str]:
+    """
+    Returns every message of `messages` obfuscated, looking up the
+    compiled pattern only once for the whole batch
+    """
+
+    pattern = _redaction_pattern(tuple(fields), separator)
+    template = _redaction_template(redaction)
+    return [pattern.sub(template, message) for message in messages]
+
+
+def filter_tokens(fields: FrozenSet[str], redaction: str,
+                  message: str, separator: str) -> str:
+    """
+    Returns the log message obfuscated without a regex: the message is
+    split on `separator` once and, as in `filter_datum`, each segment is
+    redacted from its first whitespace separated `field=` word to its
+    end; the message is rebuilt with a single join.
+    """
+
+    tokens = message.split(separator)
+    for index, token in enumerate(tokens):
+        if '=' not in token:
+            continue
+        position = 0
+        for word in token.split():
+            position = token.find(word, position)
+            name, equal, _ = word.partition('=')
+            if equal and name in fields:
+                tokens[index] = token[:position] + name + '=' + redaction
+                break
+            position += len(word)
+    return separator.join(tokens)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -26,16 +98,23 @@ class RedactingFormatter(logging.Formatter):
 
     REDACTION = "***"
     SEPARATOR = ";"
+    BACKENDS = ('regex', 'tokenize')
 
-    def __init__(self, fields):
+    def __init__(self, fields, backend: str = 'regex'):
         """
-        Initialize RedactingFormatter object
+        Initialize RedactingFormatter object. `backend` selects how
+        values are redacted: 'regex' uses `filter_datum`, 'tokenize'
+        uses `filter_tokens`.
         """
 
+        if backend not in self.BACKENDS:
+            raise ValueError('Unknown redaction backend: {}'.format(backend))
         super(RedactingFormatter, self).__init__(
             "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
             )
         self.fields = fields
+        self.backend = backend
+        self._field_set = frozenset(fields)
 
     def format(self, record: logging.LogRecord) -> str:
         """
@@ -45,70 +124,301 @@ class RedactingFormatter(logging.Formatter):
         """
 
         message = super().format(record)
+        if self.backend == 'tokenize':
+            return filter_tokens(
+                self._field_set, self.REDACTION, message, self.SEPARATOR
+                )
         return filter_datum(
             self.fields, self.REDACTION, message, self.SEPARATOR
             )
 
+    def redact_many(self, messages: Iterable[str]) -> List[str]:
+        """
+        Filter values of several already formatted messages at once
+        """
+
+        if self.backend == 'tokenize':
+            return [filter_tokens(self._field_set, self.REDACTION,
+                                  message, self.SEPARATOR)
+                    for message in messages]
+        return redact_many(
+            self.fields, self.REDACTION, messages, self.SEPARATOR
+            )
+
+    def format_many(self, records: Iterable[logging.LogRecord]) -> List[str]:
+        """
+        Format a batch of log records, then filter them all in one pass
+        with `redact_many`
+        """
+
+        base_format = super(RedactingFormatter, self).format
+        return self.redact_many([base_format(record) for record in records])
+
 
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password')
 
 
-def get_logger() -> logging.Logger:
+class BoundedQueueHandler(QueueHandler):
+    """
+    QueueHandler that either blocks or drops records when its bounded
+    queue is full
+    """
+
+    def __init__(self, record_queue: queue.Queue, block: bool = False):
+        """
+        Initialize BoundedQueueHandler object. With `block` False, records
+        arriving on a full queue are dropped and counted in `dropped`.
+        """
+
+        super(BoundedQueueHandler, self).__init__(record_queue)
+        self.block = block
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Put the record on the queue following the drop-or-block policy
+        """
+
+        try:
+            self.queue.put(record, block=self.block)
+        except queue.Full:
+            self.dropped += 1
+
+
+class FlushingQueueListener(QueueListener):
+    """
+    QueueListener that always gets its stop sentinel on the queue, so
+    every record queued before shutdown is still written
+    """
+
+    def __init__(self, record_queue: queue.Queue, *handlers,
+                 respect_handler_level: bool = False):
+        """
+        Initialize FlushingQueueListener object
+        """
+
+        super(FlushingQueueListener, self).__init__(
+            record_queue, *handlers,
+            respect_handler_level=respect_handler_level)
+        self._stop_lock = threading.Lock()
+
+    def enqueue_sentinel(self) -> None:
+        """
+        Wait for room on a full queue instead of failing to stop
+        """
+
+        self.queue.put(self._sentinel)
+
+    def stop(self) -> None:
+        """
+        Flush the queue and stop the listener thread; stopping a listener
+        that is already stopped, e.g. at exit after a manual flush, does
+        nothing
+        """
+
+        with self._stop_lock:
+            if self._thread is not None:
+                super(FlushingQueueListener, self).stop()
+
+
+def get_logger(use_queue: bool = False, max_queue_size: int = 10000,
+               block: bool = False) -> logging.Logger:
     """
-    Returns a logging.Logger object with a log message
+    Returns a logging.Logger object with a log message.
+    With `use_queue`, records are put on a bounded queue and one
+    background listener does the redaction and the stream I/O; `block`
+    chooses between waiting and dropping when the queue is full.
+    The logger is only configured once, later calls return it as is
+    and raise ValueError if they ask for another mode.
     """
 
     logger = logging.getLogger('user_data')
     logger.setLevel(logging.INFO)
     logger.propagate = False
+    for handler in logger.handlers:
+        if isinstance(handler, BoundedQueueHandler):
+            mode = (True, handler.queue.maxsize, handler.block)
+        elif isinstance(handler.formatter, RedactingFormatter):
+            mode = (False,)
+        else:
+            continue
+        wanted = (True, max_queue_size, block) if use_queue else (False,)
+        if mode != wanted:
+            raise ValueError("user_data logger is already configured with "
+                             "(use_queue, max_queue_size, block) = "
+                             "{}".format(mode))
+        return logger
 
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
-    logger.addHandler(stream_handler)
+    if not use_queue:
+        logger.addHandler(stream_handler)
+        return logger
+
+    record_queue = queue.Queue(maxsize=max_queue_size)
+    listener = FlushingQueueListener(record_queue, stream_handler)
+    queue_handler = BoundedQueueHandler(record_queue, block)
+    queue_handler.listener = listener
+    logger.addHandler(queue_handler)
+    listener.start()
+    atexit.register(listener.stop)
 
     return logger
 
 
+_db_pool = None
+
+
+def _db_config() -> dict:
+    """
+    Returns the database credentials read from the environment
+    """
+
+    return {
+        'user': os.getenv("PERSONAL_DATA_DB_USERNAME", "root"),
+        'password': os.getenv("PERSONAL_DATA_DB_PASSWORD", ""),
+        'host': os.getenv("PERSONAL_DATA_DB_HOST", "localhost"),
+        'database': os.getenv("PERSONAL_DATA_DB_NAME"),
+    }
+
+
 def get_db():
     """
     Returns a connector to the database
     """
 
-    username = os.getenv("PERSONAL_DATA_DB_USERNAME", "root")
-    password = os.getenv("PERSONAL_DATA_DB_PASSWORD", "")
-    host = os.getenv("PERSONAL_DATA_DB_HOST", "localhost")
-    db_name = os.getenv("PERSONAL_DATA_DB_NAME")
+    return mysql.connector.connect(**_db_config())
+
+
+def get_db_pool(pool_class=None):
+    """
+    Returns the process wide connection pool, created on first use with
+    `PERSONAL_DATA_DB_POOL_SIZE` connections. `pool_class` defaults to
+    `MySQLConnectionPool` and lets a local stand-in be used instead.
+    """
+
+    global _db_pool
+    if _db_pool is None:
+        if pool_class is None:
+            pool_class = mysql.connector.pooling.MySQLConnectionPool
+        _db_pool = pool_class(
+            pool_name='personal_data',
+            pool_size=int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", "5")),
+            **_db_config()
+        )
+    return _db_pool
+
+
+def get_pooled_db():
+    """
+    Returns a connector checked out of the pool, pinged first so a stale
+    connection is reconnected before use. Closing it gives it back to
+    the pool.
+    """
 
-    connector = mysql.connector.connect(
-        user=username,
-        password=password,
-        host=host,
-        database=db_name
-    )
+    connector = get_db_pool().get_connection()
+    try:
+        connector.ping(reconnect=True, attempts=3, delay=0)
+    except mysql.connector.Error:
+        connector.close()
+        raise
 
     return connector
 
 
-def main():
+def stream_rows(cursor, batch_size: int) -> Iterator[List[str]]:
+    """
+    Yields the rows of an executed cursor as batches of `field=value;`
+    messages, using the cursor's column names as fields
+    """
+
+    columns = [column[0] for column in cursor.description]
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [''.join('{}={};'.format(column, value)
+                       for column, value in zip(columns, row))
+               for row in rows]
+
+
+def main(batch_size: int = 1000) -> None:
     """
-    Connects to the database and retrieves all rows from the users table
+    Connects to the database and displays all rows from the users table
+    under a filtered format. Rows are streamed from an unbuffered cursor
+    `batch_size` at a time, so memory stays flat whatever the table size.
     """
 
+    formatter = RedactingFormatter(PII_FIELDS)
     db = get_db()
-    cursor = db.cursor()
+    cursor = db.cursor(buffered=False)
     cursor.execute("SELECT * FROM users")
-    [print(user) for user in cursor]
+
+    for messages in stream_rows(cursor, batch_size):
+        records = [logging.LogRecord('user_data', logging.INFO, None, None,
+                                     message, None, None)
+                   for message in messages]
+        sys.stdout.write(
+            ''.join(line + '\n' for line in formatter.format_many(records))
+            )
+    sys.stdout.flush()
 
     cursor.close()
     db.close()
 
 
-def hash_password(password: str) -> bytes:
+_bcrypt_rounds = None
+
+
+def calibrate_bcrypt_rounds(target_ms: float = None, min_rounds: int = 12,
+                            max_rounds: int = 16) -> int:
+    """
+    Measures this host and returns the highest bcrypt work factor whose
+    hashing stays under `target_ms` milliseconds (`min_rounds` if none
+    does). The budget defaults to `PERSONAL_DATA_BCRYPT_TARGET_MS`, or
+    100ms, and the result becomes the cost used by `hash_password`.
+    The floor is bcrypt's default cost of 12, so calibration can only
+    raise it.
+    """
+
+    global _bcrypt_rounds
+    if target_ms is None:
+        target_ms = float(os.getenv("PERSONAL_DATA_BCRYPT_TARGET_MS", "100"))
+    rounds = min_rounds
+    for candidate in range(min_rounds, max_rounds + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(candidate))
+        if (time.perf_counter() - start) * 1000 > target_ms:
+            break
+        rounds = candidate
+    _bcrypt_rounds = rounds
+
+    return rounds
+
+
+def bcrypt_rounds() -> int:
+    """
+    Returns the bcrypt work factor: `PERSONAL_DATA_BCRYPT_ROUNDS` when it
+    is set, the only way to go below 12, or else the one calibrated for
+    this host on the first call
+    """
+
+    global _bcrypt_rounds
+    if _bcrypt_rounds is None:
+        configured = os.getenv("PERSONAL_DATA_BCRYPT_ROUNDS")
+        if not configured:
+            return calibrate_bcrypt_rounds()
+        _bcrypt_rounds = int(configured)
+    return _bcrypt_rounds
+
+
+def hash_password(password: str, rounds: int = None) -> bytes:
     """
-    Hashes the password using bcrypt
+    Hashes the password using bcrypt, with the calibrated work factor
+    unless `rounds` is given
     """
 
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds or bcrypt_rounds())
     hashed_password = bcrypt.hashpw(password.encode(), salt)
 
     return hashed_password
@@ -120,3 +430,60 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     """
 
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+def _call_chunk(function: Callable, chunk: List[tuple]) -> list:
+    """
+    Calls `function` on every argument tuple of `chunk`, in a worker
+    """
+
+    return [function(*args) for args in chunk]
+
+
+def _parallel_map(function: Callable, items: Iterable[tuple],
+                  workers: int, chunksize: int) -> Iterator:
+    """
+    Yields `function(*args)` for every args of `items`, in input order,
+    computed by a process pool. Only a bounded number of chunks is in
+    flight at once, so `items` can be as large as a whole user table.
+    """
+
+    workers = workers or os.cpu_count() or 1
+    items = iter(items)
+    chunks = iter(lambda: list(islice(items, chunksize)), [])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_call_chunk, function, chunk))
+            if len(pending) > 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def hash_passwords(passwords: Iterable[str], workers: int = None,
+                   chunksize: int = 8) -> Iterator[bytes]:
+    """
+    Hashes many passwords with `hash_password` over a pool of `workers`
+    processes (one per core by default), yielding them in input order.
+    The work factor is calibrated here once, not in every worker.
+    """
+
+    rounds = bcrypt_rounds()
+    return _parallel_map(hash_password, ((password, rounds)
+                                         for password in passwords),
+                         workers, chunksize)
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]], workers: int = None,
+                chunksize: int = 8) -> Iterator[bool]:
+    """
+    Validates many (hashed_password, password) pairs with `is_valid` over
+    a pool of `workers` processes, yielding the results in input order
+    """
+
+    return _parallel_map(is_valid, pairs, workers, chunksize)
+
+
+if __name__ == "__main__":
+    main()
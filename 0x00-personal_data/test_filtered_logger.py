@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Checks for the redaction backends of filtered_logger
+"""
+
+import logging
+import unittest
+
+from filtered_logger import (PII_FIELDS, RedactingFormatter, filter_datum,
+                             filter_tokens, get_logger)
+
+
+MESSAGES = [
+    'name=a;email=b;password=c;',
+    'name=a; email=b; password=c;',
+    'name=a;  email=b;\tpassword=c; ip=d;',
+    'name=email=x; xemail=y; email =z; email=;',
+    '[HOLBERTON] user_data INFO 2019: name=a; email=b; ssn=c;',
+    'msg=hello email=bob;',
+    'a=1 email=x; b=2\tpassword=y z=3;',
+    'a=1 email=x password=y;',
+]
+
+
+class TestRedactionBackends(unittest.TestCase):
+    """
+    Both backends must redact exactly the same fields
+    """
+
+    def test_filter_tokens_matches_filter_datum(self) -> None:
+        """
+        filter_tokens gives the output of filter_datum, whatever the
+        whitespace after the separator or the pairs before a field
+        """
+
+        for fields in (['email', 'password'], ['name'], ['msg', 'ssn']):
+            for message in MESSAGES:
+                with self.subTest(fields=fields, message=message):
+                    self.assertEqual(
+                        filter_tokens(frozenset(fields), '***', message,
+                                      ';'),
+                        filter_datum(fields, '***', message, ';'))
+
+    def test_field_after_another_pair_is_redacted(self) -> None:
+        """
+        A field following another pair in the same segment is redacted
+        """
+
+        self.assertEqual(
+            filter_tokens(frozenset(['name']), '***',
+                          'msg=hello name=bob;', ';'),
+            'msg=hello name=***;')
+
+    def test_spaced_separator_is_redacted(self) -> None:
+        """
+        Fields after `; ` are redacted, the space is kept
+        """
+
+        self.assertEqual(
+            filter_tokens(frozenset(['email', 'password']), '***',
+                          'name=a; email=b; password=c;', ';'),
+            'name=a; email=***; password=***;')
+
+    def test_formatters_agree(self) -> None:
+        """
+        RedactingFormatter formats alike with either backend
+        """
+
+        formatters = [RedactingFormatter(PII_FIELDS, backend)
+                      for backend in RedactingFormatter.BACKENDS]
+        for message in MESSAGES:
+            record = logging.LogRecord('user_data', logging.INFO, None,
+                                       None, message, None, None)
+            with self.subTest(message=message):
+                outputs = {formatter.format(record)
+                           for formatter in formatters}
+                self.assertEqual(len(outputs), 1)
+
+
+class TestGetLogger(unittest.TestCase):
+    """
+    get_logger configures the user_data logger once
+    """
+
+    def tearDown(self) -> None:
+        """
+        Stop and drop the handlers a test configured
+        """
+
+        logger = logging.getLogger('user_data')
+        for handler in list(logger.handlers):
+            listener = getattr(handler, 'listener', None)
+            if listener is not None:
+                listener.stop()
+            if listener is not None or \
+                    isinstance(handler.formatter, RedactingFormatter):
+                logger.removeHandler(handler)
+
+    def test_other_mode_raises(self) -> None:
+        """
+        Asking for another mode than the configured one raises
+        """
+
+        logger = get_logger(use_queue=True, max_queue_size=10)
+        self.assertIs(get_logger(use_queue=True, max_queue_size=10), logger)
+        for kwargs in ({}, {'use_queue': True},
+                       {'use_queue': True, 'max_queue_size': 10,
+                        'block': True}):
+            with self.subTest(**kwargs):
+                with self.assertRaises(ValueError):
+                    get_logger(**kwargs)
+
+    def test_stop_twice(self) -> None:
+        """
+        A listener stopped by hand can be stopped again at exit
+        """
+
+        listener = next(handler.listener
+                        for handler in get_logger(use_queue=True).handlers
+                        if hasattr(handler, 'listener'))
+        listener.stop()
+        listener.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ Route module for the API
 """
 
 from os import getenv
+from api.v1.auth.auth import ExcludedPaths
 from api.v1.views import app_views
 from flask import Flask, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
@@ -16,6 +17,8 @@ CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 
 auth = None
 AUTH_TYPE = os.getenv("AUTH_TYPE")
+EXCLUDED_PATHS = ExcludedPaths(['/api/v1/status/', '/api/v1/unauthorized/',
+                                '/api/v1/forbidden/'])
 
 if AUTH_TYPE == 'auth':
     from api.v1.auth.auth import Auth
@@ -38,10 +41,7 @@ def before_request():
     if auth is None:
         pass
     else:
-        excluded_list = ['/api/v1/status/',
-                         '/api/v1/unauthorized/', '/api/v1/forbidden/']
-
-        if auth.require_auth(request.path, excluded_list):
+        if auth.require_auth(request.path, EXCLUDED_PATHS):
             if auth.authorization_header(request) is None:
                 abort(401, description="Unauthorized")
             if auth.current_user(request) is None:
@@ -3,23 +3,105 @@
 Module for authentication
 """
 
-from typing import List, TypeVar
+from functools import lru_cache
+from typing import List, Tuple, TypeVar, Union
 from flask import request
 
 
+class ExcludedPaths:
+    """
+    Paths excluded from authentication, compiled into a prefix trie.
+
+    A path is excluded when, with a trailing slash added if missing, it
+    starts with one of the excluded paths (without its trailing `*` for
+    wildcards). Results are memoized per path.
+    """
+
+    def __init__(self, excluded_paths: List[str]) -> None:
+        """
+        Compiles the excluded paths.
+
+        Args:
+            excluded_paths (List[str]): Paths excluded from
+            authentication, optionally ending with a `*` wildcard.
+        """
+
+        self.trie = {}
+        self.count = 0
+        for excluded_path in excluded_paths:
+            self.count += 1
+            if excluded_path.endswith('*'):
+                excluded_path = excluded_path[:-1]
+            node = self.trie
+            for char in excluded_path:
+                node = node.setdefault(char, {})
+            # '' is never a path character: it marks the end of a prefix
+            node[''] = True
+        self.matches = lru_cache(maxsize=4096)(self._matches)
+
+    def __len__(self) -> int:
+        """
+        Returns the number of excluded paths.
+        """
+
+        return self.count
+
+    def _matches(self, path: str) -> bool:
+        """
+        Checks if a path is excluded, walking the trie once.
+
+        Args:
+            path (str): The path to check.
+
+        Returns:
+            bool: True if the path is excluded, False otherwise.
+        """
+
+        if not path.endswith('/'):
+            path += '/'
+        node = self.trie
+        if '' in node:
+            return True
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                return False
+            if '' in node:
+                return True
+        return False
+
+
+@lru_cache(maxsize=64)
+def compile_excluded_paths(excluded_paths: Tuple[str, ...]) -> ExcludedPaths:
+    """
+    Compiles a list of excluded paths once.
+
+    Args:
+        excluded_paths (Tuple[str, ...]): Paths excluded from
+        authentication.
+
+    Returns:
+        ExcludedPaths: The compiled paths.
+    """
+
+    return ExcludedPaths(excluded_paths)
+
+
 class Auth:
     """
     This class provides authentication functionality.
     """
 
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    def require_auth(self, path: str,
+                     excluded_paths: Union[List[str], ExcludedPaths]) -> bool:
         """
         Checks if authentication is required for a given path.
 
         Args:
             path (str): The path to check.
-            excluded_paths (List[str]): List of paths that are excluded
-            from authentication.
+            excluded_paths (List[str] or ExcludedPaths): Paths that are
+            excluded from authentication, slash tolerant and optionally
+            ending with a `*` wildcard. Lists are compiled on first use.
 
         Returns:
             bool: True if authentication is required, False otherwise.
@@ -28,22 +110,13 @@ class Auth:
         if path is None:
             return True
 
-        if excluded_paths is None or excluded_paths == []:
+        if excluded_paths is None or len(excluded_paths) == 0:
             return True
 
-        if path in excluded_paths:
-            return False
-
-        for excluded_path in excluded_paths:
-            if excluded_path.startswith(path):
-                return False
-            elif path.startswith(excluded_path):
-                return False
-            elif excluded_path[-1] == "*":
-                if path.startswith(excluded_path[:-1]):
-                    return False
+        if not isinstance(excluded_paths, ExcludedPaths):
+            excluded_paths = compile_excluded_paths(tuple(excluded_paths))
 
-        return True
+        return not excluded_paths.matches(path)
 
     def authorization_header(self, request=None) -> str:
         """
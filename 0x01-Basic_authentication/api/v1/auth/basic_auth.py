@@ -5,7 +5,13 @@ Module for authentication using Basic auth
 
 from typing import TypeVar
 from api.v1.auth.auth import Auth
+from collections import OrderedDict
 import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
 from models.user import User
 
 
@@ -13,14 +19,42 @@ class BasicAuth(Auth):
     """
     This class provides authentication using Basic auth.
 
+    Verified Authorization headers are cached, keyed by their HMAC, so
+    repeated requests skip decoding, the user search and the password
+    check. The cache is bounded (LRU) and entries expire after a TTL.
+
     Methods:
     - extract_base64_authorization_header(authorization_header)
     - decode_base64_authorization_header(base64_authorization_header)
     - extract_user_credentials(decoded_base64_authorization_header)
     - user_object_from_credentials(user_email, user_pwd)
     - current_user(request)
+    - cache_info()
     """
 
+    def __init__(self, cache_size: int = None, cache_ttl: float = None):
+        """
+        Initializes the credential cache.
+
+        Args:
+            cache_size (int, optional): Maximum number of cached headers.
+            Defaults to BASIC_AUTH_CACHE_SIZE, or 1024.
+            cache_ttl (float, optional): Seconds an entry stays valid.
+            Defaults to BASIC_AUTH_CACHE_TTL, or 300.
+        """
+
+        if cache_size is None:
+            cache_size = int(os.getenv("BASIC_AUTH_CACHE_SIZE", "1024"))
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv("BASIC_AUTH_CACHE_TTL", "300"))
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_secret = os.urandom(32)
+        self._cache_stats = {'hits': 0, 'misses': 0,
+                             'invalidations': 0, 'evictions': 0}
+
     def extract_base64_authorization_header(
         self, authorization_header: str) -> str:
         """
@@ -141,14 +175,90 @@ class BasicAuth(Auth):
 
         auth_header = self.authorization_header(request)
         if auth_header is not None:
+            key = hmac.new(self._cache_secret, auth_header.encode('utf-8'),
+                           hashlib.sha256).digest()
+            user = self._cached_user(key)
+            if user is not None:
+                return user
             token = self.extract_base64_authorization_header(auth_header)
             if token is not None:
                 decoded = self.decode_base64_authorization_header(token)
                 if decoded is not None:
                     email, password = self.extract_user_credentials(decoded)
                     if email is not None:
-                        return self.user_object_from_credentials(
+                        user = self.user_object_from_credentials(
                             email, password
                             )
+                        if user is not None:
+                            self._cache_user(key, user)
+                        return user
 
         return
+
+    def _cached_user(self, key: bytes) -> TypeVar('User'):
+        """
+        Looks up a verified header in the cache.
+
+        An entry only counts while it hasn't expired, its user still
+        exists and that user's password hash is the one it was verified
+        against; otherwise it is dropped.
+
+        Args:
+            key (bytes): HMAC of the authorization header.
+
+        Returns:
+            User: The cached user, or None on a miss.
+        """
+
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self._cache_stats['misses'] += 1
+                return None
+            user_id, password, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                self._cache_stats['misses'] += 1
+                return None
+            self._cache.move_to_end(key)
+
+        user = User.get(user_id)
+        with self._cache_lock:
+            if user is None or user.password != password:
+                self._cache.pop(key, None)
+                self._cache_stats['invalidations'] += 1
+                self._cache_stats['misses'] += 1
+                return None
+            self._cache_stats['hits'] += 1
+        return user
+
+    def _cache_user(self, key: bytes, user: TypeVar('User')) -> None:
+        """
+        Caches a verified header, evicting the least recently used
+        entry when the cache is full.
+
+        Args:
+            key (bytes): HMAC of the authorization header.
+            user (User): The user the header was verified for.
+        """
+
+        expires_at = time.monotonic() + self.cache_ttl
+        with self._cache_lock:
+            self._cache[key] = (user.id, user.password, expires_at)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self._cache_stats['evictions'] += 1
+
+    def cache_info(self) -> dict:
+        """
+        Reports the credential cache statistics.
+
+        Returns:
+            dict: hits, misses, invalidations, evictions and current size.
+        """
+
+        with self._cache_lock:
+            info = dict(self._cache_stats)
+            info['size'] = len(self._cache)
+        return info
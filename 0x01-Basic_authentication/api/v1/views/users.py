@@ -2,18 +2,82 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import (abort, jsonify, request, Response,
+                   stream_with_context)
 from models.user import User
+import json
+
+
+# Query parameters of GET /api/v1/users that filter on a User attribute
+FILTERS = ('id', 'email', 'first_name', 'last_name')
+# Keys that `fields` can project
+FIELDS = ('id', 'email', 'first_name', 'last_name', 'created_at',
+          'updated_at', 'display_name')
+
+
+def user_json(user: User, fields: list = None) -> dict:
+    """ JSON representation of a User, only with `fields` when given
+    """
+    result = user.to_json(fields=fields)
+    if fields is not None and 'display_name' in fields:
+        result['display_name'] = user.display_name()
+    return result
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters:
+      - limit (optional): page size, pages are ordered by User ID
+      - cursor (optional): ID of the last User of the previous page
+      - format (optional): "ndjson" streams one User JSON per line
+      - fields (optional): comma separated keys to return, among
+        id, email, first_name, last_name, created_at, updated_at
+        and display_name
+      - id, email, first_name, last_name (optional): only return
+        Users with this attribute value
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, or one page of it
+        with the cursor of the next page in the X-Next-Cursor header
+      - 400 if limit isn't a positive integer, or a field is unknown
+    Other query parameters, such as cache busters, are ignored.
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    filters = {key: value for key, value in request.args.items()
+               if key in FILTERS}
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = [field for field in fields.split(',') if field]
+        for field in fields:
+            if field not in FIELDS:
+                error = "unknown field {}".format(field)
+                return jsonify({'error': error}), 400
+
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            users = User.search(filters) if filters else User.iter_all()
+            for user in users:
+                yield json.dumps(user_json(user, fields)) + "\n"
+        return Response(stream_with_context(generate()),
+                        mimetype='application/x-ndjson')
+
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        all_users = [user_json(user, fields)
+                     for user in User.search(filters)]
+        return jsonify(all_users)
+
+    try:
+        limit = int(limit) if limit is not None else 100
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        return jsonify({'error': "limit must be a positive integer"}), 400
+    users = User.page(limit + 1, cursor, filters)
+    response = jsonify([user_json(user, fields) for user in users[:limit]])
+    if len(users) > limit:
+        response.headers['X-Next-Cursor'] = users[limit - 1].id
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -21,8 +85,11 @@ def view_one_user(user_id: str = None) -> str:
     """ GET /api/v1/users/:id
     Path parameter:
       - User ID
+    Header:
+      - If-None-Match (optional): ETag of a previous response
     Return:
-      - User object JSON represented
+      - User object JSON represented, with its ETag
+      - 304 if the User didn't change since the ETag in If-None-Match
       - 404 if the User ID doesn't exist
     """
     if user_id is None:
@@ -30,7 +97,13 @@ def view_one_user(user_id: str = None) -> str:
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    etag = user.etag()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(user.to_json())
+    response.set_etag(etag)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+""" Microbenchmark of Auth.require_auth with 1000 excluded paths: the
+original loop over the list, a plain list, a precompiled ExcludedPaths
+and its trie walk without the memo
+"""
+import argparse
+import timeit
+from typing import List
+
+from api.v1.auth.auth import Auth, ExcludedPaths
+
+
+def loop_require_auth(path: str, excluded_paths: List[str]) -> bool:
+    """ require_auth as it was before ExcludedPaths, checking each
+    excluded path in turn
+    """
+    if path is None:
+        return True
+    if excluded_paths is None or excluded_paths == []:
+        return True
+    if path in excluded_paths:
+        return False
+    for excluded_path in excluded_paths:
+        if excluded_path.startswith(path):
+            return False
+        elif path.startswith(excluded_path):
+            return False
+        elif excluded_path[-1] == "*":
+            if path.startswith(excluded_path[:-1]):
+                return False
+    return True
+
+
+def main():
+    """ Print microseconds per checked path for each variant
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--patterns', type=int, default=1000,
+                        help="number of excluded paths")
+    parser.add_argument('--number', type=int, default=200,
+                        help="passes over the request paths")
+    args = parser.parse_args()
+
+    auth = Auth()
+    excluded = ['/api/v1/r{}/'.format(i) for i in range(args.patterns)]
+    paths = ['/api/v1/users/{}'.format(i) for i in range(50)]
+    paths.append('/api/v1/r{}/x'.format(args.patterns - 1))
+    compiled = ExcludedPaths(excluded)
+    for path in paths:
+        assert loop_require_auth(path, excluded) == \
+            auth.require_auth(path, compiled)
+
+    variants = [
+        ('original loop', lambda path: loop_require_auth(path, excluded)),
+        ('list', lambda path: auth.require_auth(path, excluded)),
+        ('ExcludedPaths', lambda path: auth.require_auth(path, compiled)),
+        ('trie, no memo', compiled._matches),
+    ]
+    print("{} excluded paths, {} request paths".format(
+        len(excluded), len(paths)))
+    for name, check in variants:
+        seconds = timeit.timeit(lambda: [check(path) for path in paths],
+                                number=args.number)
+        print("{:<14} {:8.2f} us/path".format(
+            name, seconds / args.number / len(paths) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,244 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from functools import lru_cache
+import hashlib
+from typing import TypeVar, List, Iterable, Iterator, Tuple
+import heapq
+from os import getenv, path
 import json
+import os
+import threading
+import time
 import uuid
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ReadWriteLock():
+    """ Lock shared by any number of readers and exclusive for writers.
+    Waiting writers go first, so a stream of reads can't starve them.
+    Not reentrant: don't take it again while holding it.
+    """
+
+    def __init__(self):
+        """ Initialize an unlocked ReadWriteLock
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        """ Hold the lock shared for the duration of the block
+        """
+        with self._cond:
+            while self._writer or self._writers_waiting > 0:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """ Hold the lock exclusively for the duration of the block
+        """
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers > 0:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class RawRecord(tuple):
+    """ Compact, not yet parsed object kept in DATA by the lazy mode: the
+    tuple of its attribute names, shared by all records of the same
+    shape, followed by its raw JSON values
+    """
+
+    __slots__ = ()
+    LAYOUTS = {}
+
+    @classmethod
+    def from_dict(cls, obj_json: dict) -> TypeVar('RawRecord'):
+        """ Build a RawRecord from a serialized object
+        """
+        keys = tuple(obj_json)
+        keys = cls.LAYOUTS.setdefault(keys, keys)
+        return cls((keys,) + tuple(obj_json.values()))
+
+    def attribute(self, name: str, default=None):
+        """ Raw value of one attribute
+        """
+        try:
+            return self[self[0].index(name) + 1]
+        except ValueError:
+            return default
+
+    def to_dict(self) -> dict:
+        """ Serialized object, as found in the JSON file
+        """
+        return dict(zip(self[0], self[1:]))
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+INDEXED_VALUES = {}
+# IDs of each class kept sorted, for keyset pagination
+SORTED_IDS = {}
+# Guards DATA and the indexes: shared to iterate, exclusive to change.
+# Taken after STORE_LOCK, never the other way round.
+DATA_LOCK = ReadWriteLock()
+# Keep loaded objects as RawRecord until they are accessed
+LAZY_LOAD = getenv("MODELS_LAZY_LOAD", "0") == "1"
+MATERIALIZE_LOCK = threading.Lock()
+
+# "json" rewrites the whole .db_<Class>.json on every change, "journal"
+# appends one line per change to .db_<Class>.journal instead
+STORAGE = getenv("MODELS_STORAGE", "json")
+COMPACT_INTERVAL = float(getenv("MODELS_COMPACT_INTERVAL", "60"))
+# fsync snapshot and journal writes (group commit always does)
+FSYNC = getenv("MODELS_FSYNC", "0") == "1"
+STORE_LOCK = threading.RLock()
+JOURNAL_SIZES = {}
+COMPACTORS = {}
+# Changes not written yet, queued under DATA_LOCK in the order they were
+# made in memory, and written in that order
+PENDING = {}
+
+# Group commit: changes made within GROUP_COMMIT_MS milliseconds, or up to
+# GROUP_COMMIT_OPS of them, share one fsynced write (0 disables it)
+GROUP_COMMIT_MS = float(getenv("MODELS_GROUP_COMMIT_MS", "0"))
+GROUP_COMMIT_OPS = int(getenv("MODELS_GROUP_COMMIT_OPS", "100"))
+COMMITTERS = {}
+
+
+def dumps(obj) -> bytes:
+    """ Serialize to JSON bytes, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def loads(data: bytes):
+    """ Parse JSON bytes, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class GroupCommit():
+    """ Merge the changes committed within a short window into one
+    durable write
+    """
+
+    class Batch():
+        """ Changes waiting for the same write
+        """
+
+        def __init__(self):
+            """ Initialize an empty batch
+            """
+            self.entries = []
+            self.full = threading.Event()
+            self.done = threading.Event()
+            self.error = None
+
+    def __init__(self, write, window: float, max_ops: int):
+        """ Initialize a GroupCommit writing batches with `write`,
+        a callable taking the list of entries of a batch
+        """
+        self.write = write
+        self.window = window
+        self.max_ops = max_ops
+        self.lock = threading.Lock()
+        self.batch = None
+
+    def commit(self, entry: dict):
+        """ Add a change to the current batch and return once that
+        batch is on disk. The first caller of a batch waits for the
+        window to end, or the batch to fill, then writes it for all.
+        """
+        with self.lock:
+            batch = self.batch
+            leader = batch is None
+            if leader:
+                batch = self.batch = GroupCommit.Batch()
+            batch.entries.append(entry)
+            if len(batch.entries) >= self.max_ops:
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self.lock:
+                self.batch = None
+            try:
+                self.write(batch.entries)
+            except Exception as e:
+                batch.error = e
+            batch.done.set()
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+
+# Slots holding caches rather than attributes of the object
+TRANSIENT_SLOTS = ('_json_cache',)
+
+
+@lru_cache(maxsize=None)
+def slot_names(cls: type) -> Tuple[str, ...]:
+    """ Names of the __slots__ of a class and of its parents, parents
+    first, i.e. in the order their attributes are set by __init__
+    """
+    names = ()
+    for klass in reversed(cls.__mro__):
+        slots = klass.__dict__.get('__slots__', ())
+        slots = (slots,) if isinstance(slots, str) else tuple(slots)
+        names += tuple(name for name in slots if name not in TRANSIENT_SLOTS)
+    return names
 
 
 class Base():
     """ Base class
     """
 
+    # Attributes live in slots rather than in a per-instance __dict__
+    __slots__ = ('id', 'created_at', 'updated_at', '_json_cache')
+
+    # Attributes with a secondary hash index, used by search
+    INDEXED_ATTRIBUTES = ()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
+            self.__class__._reset_indexes()
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
@@ -44,62 +261,323 @@ class Base():
             return False
         return (self.id == other.id)
 
-    def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, dropping the memoized JSON of the object
+        """
+        object.__setattr__(self, name, value)
+        if name != '_json_cache':
+            object.__setattr__(self, '_json_cache', None)
+
+    def etag(self) -> str:
+        """ Version tag of the object, changing on each save
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
+        version = "{}:{}".format(self.id, self.updated_at.isoformat())
+        return hashlib.blake2b(version.encode(), digest_size=16).hexdigest()
+
+    def _attributes(self) -> Iterable[Tuple[str, object]]:
+        """ Attribute names and values of the object, slots first, then
+        the __dict__ of subclasses that don't declare __slots__
+        """
+        for name in slot_names(self.__class__):
+            try:
+                yield name, getattr(self, name)
+            except AttributeError:
                 continue
-            if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
-        return result
+        if hasattr(self, '__dict__'):
+            yield from self.__dict__.items()
+
+    def to_json(self, for_serialization: bool = False,
+                fields: Iterable[str] = None) -> dict:
+        """ Convert the object a JSON dictionary, keeping only the keys
+        in `fields` when given. The conversion is memoized until an
+        attribute of the object changes, e.g. on save.
+        """
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            cache = {}
+            object.__setattr__(self, '_json_cache', cache)
+        result = cache.get(for_serialization)
+        if result is None:
+            result = {}
+            for key, value in self._attributes():
+                if not for_serialization and key[0] == '_':
+                    continue
+                if type(value) is datetime:
+                    result[key] = value.strftime(TIMESTAMP_FORMAT)
+                else:
+                    result[key] = value
+            cache[for_serialization] = result
+        if fields is None:
+            return dict(result)
+        return {key: value for key, value in result.items()
+                if key in fields}
 
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from file, then replay the journal
+        written since that file
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        journal_path = ".db_{}.journal".format(s_class)
+        objs = {}
+        journal_size = 0
+        build = RawRecord.from_dict if LAZY_LOAD else (lambda d: cls(**d))
+
+        if path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                objs_json = loads(f.read())
+                for obj_id, obj_json in objs_json.items():
+                    objs[obj_id] = build(obj_json)
+                del objs_json
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        if path.exists(journal_path):
+            with open(journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        # torn last line of an interrupted append
+                        break
+                    if entry['op'] == 'save':
+                        objs[entry['id']] = build(entry['obj'])
+                    else:
+                        objs.pop(entry['id'], None)
+                    journal_size += 1
+
+        with DATA_LOCK.write():
+            DATA[s_class] = objs
+            cls._reset_indexes()
+            for obj in objs.values():
+                cls._index_add(obj)
+            SORTED_IDS[s_class] = sorted(objs)
+            JOURNAL_SIZES[s_class] = journal_size
+
+    @classmethod
+    def _reset_indexes(cls):
+        """ Empty the secondary indexes and sorted IDs of the class
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {attr: {} for attr in cls.INDEXED_ATTRIBUTES}
+        INDEXED_VALUES[s_class] = {}
+        SORTED_IDS[s_class] = []
+
+    @classmethod
+    def _index_add(cls, obj: TypeVar('Base')):
+        """ Index an object, or a RawRecord, under its current attribute
+        values
+        """
+        s_class = cls.__name__
+        if isinstance(obj, RawRecord):
+            obj_id, value_of = obj.attribute('id'), obj.attribute
+        else:
+            obj_id = obj.id
+
+            def value_of(attr):
+                return getattr(obj, attr, None)
+        cls._index_remove(obj_id)
+        values = {}
+        for attr, index in INDEXES[s_class].items():
+            value = value_of(attr)
+            try:
+                index.setdefault(value, {})[obj_id] = None
+            except TypeError:
+                continue
+            values[attr] = value
+        INDEXED_VALUES[s_class][obj_id] = values
+
+    @classmethod
+    def _materialize(cls, obj_id: str) -> TypeVar('Base'):
+        """ Return the object stored under `obj_id`, turning it from a
+        RawRecord into an instance first if needed. Call it with
+        DATA_LOCK held for reading.
+        """
+        s_class = cls.__name__
+        with MATERIALIZE_LOCK:
+            obj = DATA[s_class].get(obj_id)
+            if isinstance(obj, RawRecord):
+                obj = cls(**obj.to_dict())
+                DATA[s_class][obj_id] = obj
+        return obj
 
     @classmethod
-    def save_to_file(cls):
-        """ Save all objects to file
+    def _index_remove(cls, obj_id: str):
+        """ Drop an object from the indexes, under the values it was
+        indexed with
+        """
+        s_class = cls.__name__
+        values = INDEXED_VALUES[s_class].pop(obj_id, {})
+        for attr, value in values.items():
+            bucket = INDEXES[s_class][attr].get(value)
+            if bucket is not None:
+                bucket.pop(obj_id, None)
+                if len(bucket) == 0:
+                    del INDEXES[s_class][attr][value]
+
+    @classmethod
+    def save_to_file(cls, sync: bool = None):
+        """ Save all objects to file, which makes the journal obsolete.
+        The snapshot is written to a temporary file then renamed over
+        the previous one, so readers never see a partial file. With
+        `sync` (FSYNC by default), it is fsynced before returning.
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        journal_path = ".db_{}.journal".format(s_class)
+        if sync is None:
+            sync = FSYNC
+        with STORE_LOCK:
+            objs_json = {}
+            with DATA_LOCK.read():
+                for obj_id, obj in DATA[s_class].items():
+                    if isinstance(obj, RawRecord):
+                        objs_json[obj_id] = obj.to_dict()
+                    else:
+                        objs_json[obj_id] = obj.to_json(True)
+
+            # Created like open() would, so the umask applies, and given
+            # the mode of the snapshot it replaces when there is one
+            tmp_path = "{}.{}.tmp".format(file_path, uuid.uuid4().hex)
+            fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY,
+                         0o666)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    try:
+                        os.fchmod(f.fileno(),
+                                  os.stat(file_path).st_mode & 0o777)
+                    except FileNotFoundError:
+                        pass
+                    f.write(dumps(objs_json))
+                    if sync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, file_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            if sync:
+                dir_fd = os.open(".", os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            if path.exists(journal_path):
+                os.remove(journal_path)
+            JOURNAL_SIZES[s_class] = 0
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def append_to_journal(cls, entries: List[dict], sync: bool = None):
+        """ Append changes to the journal of the class, in one write.
+        With `sync` (FSYNC by default), it is fsynced before returning.
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        lines = b"".join(dumps(entry) + b"\n" for entry in entries)
+        if sync is None:
+            sync = FSYNC
+        with STORE_LOCK:
+            with open(journal_path, 'ab') as f:
+                f.write(lines)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            JOURNAL_SIZES[s_class] = \
+                JOURNAL_SIZES.get(s_class, 0) + len(entries)
+            if s_class not in COMPACTORS:
+                COMPACTORS[s_class] = threading.Thread(
+                    target=cls._compact_periodically, daemon=True)
+                COMPACTORS[s_class].start()
+
+    @classmethod
+    def compact(cls):
+        """ Rewrite the snapshot file if the journal has changes
+        """
+        with STORE_LOCK:
+            if JOURNAL_SIZES.get(cls.__name__, 0) > 0:
+                cls.save_to_file()
+
+    @classmethod
+    def _compact_periodically(cls):
+        """ Compact the journal every COMPACT_INTERVAL seconds
+        """
+        while True:
+            time.sleep(COMPACT_INTERVAL)
+            cls.compact()
+
+    @classmethod
+    def _write(cls, entries: List[dict], sync: bool = None):
+        """ Persist changes following STORAGE
+        """
+        if STORAGE == "journal":
+            cls.append_to_journal(entries, sync)
+        else:
+            cls.save_to_file(sync)
+
+    @classmethod
+    def _reserve(cls, entry: dict):
+        """ Queue a change to persist. Call it with DATA_LOCK held for
+        writing, so changes reach disk in the order they hit memory.
+        """
+        PENDING.setdefault(cls.__name__, deque()).append(entry)
+
+    @classmethod
+    def _flush(cls, sync: bool = None):
+        """ Write the queued changes of the class, oldest first. Once it
+        returns, every change queued before the call is written.
+        """
+        s_class = cls.__name__
+        with STORE_LOCK:
+            pending = PENDING.get(s_class)
+            entries = []
+            while pending:
+                entries.append(pending.popleft())
+            if entries:
+                cls._write(entries, sync)
+
+    @classmethod
+    def _persist(cls, entry: dict):
+        """ Persist a change queued by _reserve, grouped with concurrent
+        ones into a single fsynced write when group commit is enabled
+        """
+        if GROUP_COMMIT_MS <= 0:
+            cls._flush()
+            return
+        s_class = cls.__name__
+        with STORE_LOCK:
+            if s_class not in COMMITTERS:
+                COMMITTERS[s_class] = GroupCommit(
+                    lambda entries: cls._flush(True),
+                    GROUP_COMMIT_MS / 1000, GROUP_COMMIT_OPS)
+        COMMITTERS[s_class].commit(entry)
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        with DATA_LOCK.write():
+            if self.id not in DATA[s_class]:
+                insort(SORTED_IDS[s_class], self.id)
+            DATA[s_class][self.id] = self
+            self.__class__._index_add(self)
+            entry = {'op': 'save', 'id': self.id, 'obj': self.to_json(True)}
+            self.__class__._reserve(entry)
+        self.__class__._persist(entry)
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with DATA_LOCK.write():
+            removed = DATA[s_class].pop(self.id, None) is not None
+            if removed:
+                self.__class__._index_remove(self.id)
+                ids = SORTED_IDS[s_class]
+                del ids[bisect_left(ids, self.id)]
+                entry = {'op': 'remove', 'id': self.id}
+                self.__class__._reserve(entry)
+        if removed:
+            self.__class__._persist(entry)
 
     @classmethod
     def count(cls) -> int:
@@ -114,16 +592,54 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, limit: int, after: str = None,
+             attributes: dict = None) -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects ordered by ID, starting after
+        the ID `after` (keyset pagination), among the objects matching
+        `attributes` when given
+        """
+        s_class = cls.__name__
+        if attributes:
+            objs = cls.search(attributes)
+            if after is not None:
+                objs = [obj for obj in objs if obj.id > after]
+            return heapq.nsmallest(limit, objs, key=lambda obj: obj.id)
+        with DATA_LOCK.read():
+            ids = SORTED_IDS[s_class]
+            start = 0 if after is None else bisect_right(ids, after)
+            ids = ids[start:start + limit]
+        objs = (cls.get(obj_id) for obj_id in ids)
+        return [obj for obj in objs if obj is not None]
+
+    @classmethod
+    def iter_all(cls) -> Iterator[TypeVar('Base')]:
+        """ Yield all objects one at a time, for streaming. Only the IDs
+        are copied up front; objects removed meanwhile are skipped.
+        """
+        s_class = cls.__name__
+        with DATA_LOCK.read():
+            ids = list(DATA[s_class].keys())
+        for obj_id in ids:
+            obj = cls.get(obj_id)
+            if obj is not None:
+                yield obj
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
         s_class = cls.__name__
-        return DATA[s_class].get(id)
+        obj = DATA[s_class].get(id)
+        if isinstance(obj, RawRecord):
+            with DATA_LOCK.read():
+                obj = cls._materialize(id)
+        return obj
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
-        """ Search all objects with matching attributes
+        """ Search all objects with matching attributes, through an
+        index when one of the attributes has one
         """
         s_class = cls.__name__
         def _search(obj):
@@ -133,5 +649,21 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        with DATA_LOCK.read():
+            objs = DATA[s_class]
+            candidates = objs.values()
+            for attr, index in INDEXES.get(s_class, {}).items():
+                if attr not in attributes:
+                    continue
+                try:
+                    candidates = [objs[obj_id] for obj_id
+                                  in index.get(attributes[attr], {})]
+                except TypeError:
+                    continue
+                break
+            if LAZY_LOAD:
+                candidates = [cls._materialize(obj.attribute('id'))
+                              if isinstance(obj, RawRecord) else obj
+                              for obj in candidates]
+            return list(filter(_search, candidates))
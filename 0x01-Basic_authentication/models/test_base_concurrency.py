@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+""" Stress test of concurrent saves and removes: what is reloaded from
+disk must match memory, in every storage mode
+"""
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from models import base
+from models.base import DATA
+from models.user import User
+
+
+THREADS = 8
+OWNED = 25
+UPDATES = 20
+SHARED = 10
+ROUNDS = 200
+
+
+def stored() -> dict:
+    """ Serialized users currently in memory
+    """
+    return {obj_id: User.get(obj_id).to_json(True)
+            for obj_id in DATA['User']}
+
+
+class TestConcurrentPersistence(unittest.TestCase):
+    """ Hammer User.save and User.remove from many threads, then reload
+    """
+
+    def setUp(self):
+        """ Work in an empty directory, without compaction thread
+        """
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.patches = [
+            mock.patch.dict(base.COMPACTORS, {'User': None}),
+            mock.patch.dict(base.COMMITTERS, clear=True),
+            mock.patch.dict(base.PENDING, clear=True),
+        ]
+        for patch in self.patches:
+            patch.start()
+        User.load_from_file()
+
+    def tearDown(self):
+        """ Go back to the original directory and data
+        """
+        for patch in reversed(self.patches):
+            patch.stop()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        User.load_from_file()
+
+    def hammer(self):
+        """ Concurrent updates of owned users, and saves racing removes
+        of shared ones
+        """
+        shared = [User(email='shared{}@x.y'.format(i)) for i in range(SHARED)]
+        for user in shared:
+            user.save()
+        errors = []
+
+        def own(number: int):
+            users = [User(email='{}-{}@x.y'.format(number, i))
+                     for i in range(OWNED)]
+            for update in range(UPDATES):
+                for user in users:
+                    user.last_name = str(update)
+                    user.save()
+
+        def race(number: int):
+            for turn in range(ROUNDS):
+                user = shared[(number + turn) % SHARED]
+                if (number + turn) % 2:
+                    user.remove()
+                else:
+                    user.first_name = str(turn)
+                    user.save()
+
+        def run(target, number):
+            try:
+                target(number)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(target, number))
+                   for number in range(THREADS) for target in (own, race)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        in_memory = stored()
+        self.assertEqual(
+            sum(1 for obj_id in in_memory
+                if in_memory[obj_id]['last_name'] == str(UPDATES - 1)),
+            THREADS * OWNED)
+        User.load_from_file()
+        self.assertEqual(stored(), in_memory)
+
+    def test_json(self):
+        """ Whole-file snapshots
+        """
+        with mock.patch.object(base, 'STORAGE', 'json'):
+            self.hammer()
+
+    def test_journal(self):
+        """ Append-only journal
+        """
+        with mock.patch.object(base, 'STORAGE', 'journal'):
+            self.hammer()
+
+    def test_journal_group_commit(self):
+        """ Append-only journal with group commit
+        """
+        with mock.patch.object(base, 'STORAGE', 'journal'), \
+                mock.patch.object(base, 'GROUP_COMMIT_MS', 2):
+            self.hammer()
+
+
+if __name__ == '__main__':
+    unittest.main()
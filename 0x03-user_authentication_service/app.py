@@ -11,6 +11,15 @@ app = Flask(__name__)
 AUTH = Auth()
 
 
+@app.teardown_appcontext
+def end_request(exception: BaseException = None) -> None:
+    """
+    Releases the request thread's database session
+    """
+
+    AUTH.end_request()
+
+
 @app.route('/', methods=['GET'], strict_slashes=False)
 def index() -> str:
     """
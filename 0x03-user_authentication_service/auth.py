@@ -6,14 +6,70 @@ Auth module
 from db import DB
 from user import User
 import bcrypt
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.orm.exc import NoResultFound
 from uuid import uuid4
 from typing import Union
 
 
+_bcrypt_rounds = None
+
+
+def calibrate_bcrypt_rounds(target_ms: float = 100, min_rounds: int = 12,
+                            max_rounds: int = 16) -> int:
+    """
+    Measures this host and picks the bcrypt work factor used from now on.
+    The floor is bcrypt's default cost of 12, so calibration can only
+    raise it; USER_AUTH_BCRYPT_ROUNDS is the way to go lower.
+
+    Args:
+        target_ms (float): The latency budget of one hash, in milliseconds.
+        min_rounds (int): The lowest work factor ever used.
+        max_rounds (int): The highest work factor tried.
+
+    Returns:
+        int: The highest work factor hashing under `target_ms`, or
+        `min_rounds` if none does.
+    """
+
+    global _bcrypt_rounds
+    rounds = min_rounds
+    for candidate in range(min_rounds, max_rounds + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(candidate))
+        if (time.perf_counter() - start) * 1000 > target_ms:
+            break
+        rounds = candidate
+    _bcrypt_rounds = rounds
+    return rounds
+
+
+def bcrypt_rounds() -> int:
+    """
+    Gets the bcrypt work factor: the fleet-wide USER_AUTH_BCRYPT_ROUNDS
+    when configured, so that every host agrees on it, or else the one
+    calibrated once for this host.
+
+    Returns:
+        int: The configured work factor.
+    """
+
+    global _bcrypt_rounds
+    if _bcrypt_rounds is None:
+        configured = os.getenv('USER_AUTH_BCRYPT_ROUNDS')
+        if configured:
+            _bcrypt_rounds = int(configured)
+        else:
+            return calibrate_bcrypt_rounds()
+    return _bcrypt_rounds
+
+
 def _hash_password(password: str) -> bytes:
     """
-    Hashes a password with bcrypt.
+    Hashes a password with bcrypt, at the calibrated work factor.
 
     Args:
         password (str): The password to hash.
@@ -22,7 +78,28 @@ def _hash_password(password: str) -> bytes:
         bytes: The hashed password.
     """
 
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(
+        password.encode('utf-8'), bcrypt.gensalt(bcrypt_rounds())
+        )
+
+
+def _hash_cost(hashed_password: bytes) -> int:
+    """
+    Reads the work factor a bcrypt hash was made with.
+
+    Args:
+        hashed_password (bytes): A bcrypt hash, such as b'$2b$12$...'.
+
+    Returns:
+        int: The work factor of the hash, 0 if it isn't a bcrypt hash.
+    """
+
+    if isinstance(hashed_password, str):
+        hashed_password = hashed_password.encode('utf-8')
+    try:
+        return int(hashed_password.split(b'$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return 0
 
 
 def _generate_uuid() -> str:
@@ -43,10 +120,16 @@ class Auth:
 
     def __init__(self) -> None:
         """
-        Initialize a new Auth instance.
+        Initialize a new Auth instance and calibrate the bcrypt work
+        factor at startup rather than on the first request.
         """
 
         self._db = DB()
+        bcrypt_rounds()
+        self._rehash_executor = ThreadPoolExecutor(max_workers=1)
+        self._rehash_lock = threading.Lock()
+        self._rehash_pending = set()
+        self.rehash_counters = {'detected': 0, 'rehashed': 0, 'skipped': 0}
 
     def register_user(self, email: str, password: str) -> User:
         """
@@ -83,15 +166,88 @@ class Auth:
         try:
             user = self._db.find_user_by(email=email)
             if user is not None:
-                return bcrypt.checkpw(
+                valid = bcrypt.checkpw(
                     password.encode('utf-8'),
                     user.hashed_password,
                     )
+                if valid and \
+                        _hash_cost(user.hashed_password) < bcrypt_rounds():
+                    self._schedule_rehash(
+                        user.id, user.hashed_password, password
+                        )
+                return valid
         except NoResultFound:
             return False
 
         return False
 
+    def _schedule_rehash(self, user_id: int, old_hash: bytes,
+                         password: str) -> None:
+        """
+        Re-hashes a password at the configured work factor in the
+        background, so the login answering does not wait for it.
+
+        Args:
+            user_id (int): The ID of the user whose hash is outdated.
+            old_hash (bytes): The outdated hash checked at login.
+            password (str): The password that just matched `old_hash`.
+        """
+
+        with self._rehash_lock:
+            if user_id in self._rehash_pending:
+                return
+            self._rehash_pending.add(user_id)
+            self.rehash_counters['detected'] += 1
+        self._rehash_executor.submit(
+            self._rehash, user_id, old_hash, password
+            )
+
+    def _rehash(self, user_id: int, old_hash: bytes, password: str) -> None:
+        """
+        Stores a new hash of `password`, unless the user's hash changed
+        since the login that scheduled it.
+
+        Args:
+            user_id (int): The ID of the user to update.
+            old_hash (bytes): The outdated hash checked at login.
+            password (str): The password that matched `old_hash`.
+        """
+
+        try:
+            new_hash = _hash_password(password)
+            updated = self._db.update_users_where(
+                {'id': user_id, 'hashed_password': old_hash},
+                hashed_password=new_hash,
+            )
+            counter = 'rehashed' if updated else 'skipped'
+        finally:
+            self._db.remove_session()
+            with self._rehash_lock:
+                self._rehash_pending.discard(user_id)
+        with self._rehash_lock:
+            self.rehash_counters[counter] += 1
+
+    def end_request(self) -> None:
+        """
+        Releases the database session of the calling thread, at the end of
+        the request it served.
+        """
+
+        self._db.remove_session()
+
+    def outdated_hash_count(self) -> int:
+        """
+        Counts the stored hashes made below the configured work factor,
+        or not made by bcrypt at all.
+
+        Returns:
+            int: The number of users still on a weaker bcrypt cost.
+        """
+
+        rounds = bcrypt_rounds()
+        return sum(1 for hashed_password in self._db.iter_hashed_passwords()
+                   if _hash_cost(hashed_password) < rounds)
+
     def create_session(self, email: str) -> str:
         """
         Creates a new session for a user.
@@ -103,19 +259,12 @@ class Auth:
             str: The new session ID.
         """
 
-        user = None
-        try:
-            user = self._db.find_user_by(email=email)
-        except NoResultFound:
-            return None
-        if user is None:
+        if email is None:
             return None
-
         session_id = _generate_uuid()
-        self._db.update_user(
-            user.id,
-            session_id=session_id
-            )
+        if not self._db.update_users_where(
+                {'email': email}, session_id=session_id):
+            return None
 
         return session_id
 
@@ -159,15 +308,12 @@ class Auth:
             str: The reset token.
         """
 
-        user = None
-        try:
-            user = self._db.find_user_by(email=email)
-        except NoResultFound:
-            user = None
-        if user is None:
+        if email is None:
             raise ValueError()
         reset_token = _generate_uuid()
-        self._db.update_user(user.id, reset_token=reset_token)
+        if not self._db.update_users_where(
+                {'email': email}, reset_token=reset_token):
+            raise ValueError()
         return reset_token
 
     def update_password(self, reset_token: str, password: str) -> None:
@@ -188,9 +334,10 @@ class Auth:
         if user is None:
             raise ValueError()
         new_password_hash = _hash_password(password)
-        self._db.update_user(
-            user.id,
-            hashed_password=new_password_hash,
-            reset_token=None,
-        )
+        if not self._db.update_users_where(
+                {'id': user.id, 'reset_token': reset_token},
+                hashed_password=new_password_hash,
+                reset_token=None,
+        ):
+            raise ValueError()
         return None
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark of find_user_by(email=...) on a users table of 10k, 100k and
+1M rows, before and after DB.migrate() adds the lookup indexes
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from typing import Callable, List
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from db import DB, _find_statement
+
+
+def populate(path: str, rows: int) -> None:
+    """
+    Creates an unindexed users table, as built before the indexes were
+    declared, and fills it.
+
+    Args:
+        path (str): The SQLite file to create.
+        rows (int): The number of users to insert.
+    """
+
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE users (id INTEGER PRIMARY KEY, "
+        "email VARCHAR(250) NOT NULL, hashed_password VARCHAR(250) NOT NULL, "
+        "session_id VARCHAR(250), reset_token VARCHAR(250))")
+    connection.executemany(
+        "INSERT INTO users (email, hashed_password, session_id, reset_token) "
+        "VALUES (?, ?, ?, ?)",
+        (('user{}@bench.test'.format(i), 'hash', str(uuid.uuid4()),
+          None if i % 100 else str(uuid.uuid4())) for i in range(rows)))
+    connection.commit()
+    connection.close()
+
+
+def per_lookup(find: Callable[[str], object], emails: List[str]) -> float:
+    """
+    Times lookups by email.
+
+    Args:
+        find (Callable[[str], object]): Looks one email up.
+        emails (List[str]): The emails to look up, all present.
+
+    Returns:
+        float: The mean time of one lookup, in milliseconds.
+    """
+
+    find(emails[0])
+    start = time.perf_counter()
+    for email in emails:
+        find(email)
+    return (time.perf_counter() - start) / len(emails) * 1000
+
+
+def main() -> None:
+    """
+    Prints, for each table size, the lookup time on the unindexed table,
+    the time migrate() takes and the lookup time once indexed.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='*',
+                        default=[10000, 100000, 1000000],
+                        help="table sizes")
+    parser.add_argument('--lookups', type=int, default=50,
+                        help="lookups per measurement")
+    args = parser.parse_args()
+
+    print("{:>8}  {:>10}  {:>10}  {:>9}".format(
+        'rows', 'scan', 'indexed', 'migrate'))
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            path = os.path.join(directory, 'users_{}.db'.format(rows))
+            populate(path, rows)
+            url = 'sqlite:///' + path
+            emails = ['user{}@bench.test'.format(i * 7919 % rows)
+                      for i in range(args.lookups)]
+
+            session = Session(create_engine(url))
+            statement = _find_statement(('email',))
+            scan = per_lookup(lambda email: session.scalars(
+                statement, {'f_email': email}).first(), emails)
+            session.close()
+
+            start = time.perf_counter()
+            db = DB(url)
+            migrate = time.perf_counter() - start
+            indexed = per_lookup(
+                lambda email: db.find_user_by(email=email), emails)
+            db.remove_session()
+
+            print("{:>8}  {:>7.2f} ms  {:>7.2f} ms  {:>7.2f} s".format(
+                rows, scan, indexed, migrate))
+
+
+if __name__ == "__main__":
+    main()
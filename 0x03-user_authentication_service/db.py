@@ -3,40 +3,212 @@
 DB module
 """
 
-from sqlalchemy import create_engine, tuple_
+import os
+from sqlalchemy import (and_, bindparam, create_engine, event, inspect,
+                        select, update)
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.session import Session
+from sqlalchemy.pool import StaticPool
+from typing import Iterator, Optional, Tuple, Union
 from user import Base, User
 
 
+DEFAULT_URL = "sqlite:///a.db"
+COLUMNS = frozenset(User.__table__.columns.keys())
+_FIND_STATEMENTS = {}
+_MIGRATED = set()
+_UPDATE_STATEMENTS = {}
+
+
+def _find_statement(keys: Tuple[str, ...]):
+    """
+    Builds, once per set of filter keys, the SELECT of the first user
+    whose columns equal the `f_<key>` bound parameters.
+
+    Args:
+        keys (Tuple[str, ...]): The sorted filter keys.
+
+    Returns:
+        Select: The cached statement.
+    """
+
+    statement = _FIND_STATEMENTS.get(keys)
+    if statement is None:
+        statement = select(User).where(and_(*[
+            getattr(User, key) == bindparam('f_' + key) for key in keys
+        ])).limit(1)
+        _FIND_STATEMENTS[keys] = statement
+    return statement
+
+
+def _update_statement(where: Tuple[str, ...], keys: Tuple[str, ...],
+                      returning: Tuple[str, ...] = ()):
+    """
+    Builds, once per shape, the UPDATE of the users whose `where` columns
+    equal the `w_<key>` bound parameters, setting each of `keys` to the
+    `v_<key>` bound parameter.
+
+    Args:
+        where (Tuple[str, ...]): The sorted filter columns.
+        keys (Tuple[str, ...]): The sorted column names to update.
+        returning (Tuple[str, ...]): The columns to return, if any.
+
+    Returns:
+        Update: The cached statement.
+    """
+
+    shape = (where, keys, returning)
+    statement = _UPDATE_STATEMENTS.get(shape)
+    if statement is None:
+        statement = update(User).where(and_(*[
+            getattr(User, key) == bindparam('w_' + key) for key in where
+        ])).values({key: bindparam('v_' + key) for key in keys})
+        if returning:
+            statement = statement.returning(
+                *[getattr(User, key) for key in returning])
+        _UPDATE_STATEMENTS[shape] = statement
+    return statement
+
+
+def _in_memory(url: str) -> bool:
+    """
+    Tells whether a database URL names a private in-memory SQLite database.
+
+    Args:
+        url (str): The database URL.
+
+    Returns:
+        bool: True for sqlite:// and sqlite:///:memory:.
+    """
+
+    return url.startswith('sqlite') and \
+        make_url(url).database in (None, '', ':memory:')
+
+
+def _engine_options(url: str) -> dict:
+    """
+    Reads the connection pool settings from the USER_AUTH_DB_POOL_SIZE,
+    USER_AUTH_DB_MAX_OVERFLOW, USER_AUTH_DB_POOL_TIMEOUT and
+    USER_AUTH_DB_POOL_RECYCLE environment variables.
+
+    Args:
+        url (str): The database URL the engine connects to.
+
+    Returns:
+        dict: The keyword arguments for `create_engine`.
+    """
+
+    options = {'echo': False, 'pool_pre_ping': True}
+    if _in_memory(url):
+        # An in-memory database only lives as long as its connection, so
+        # every thread has to share that one connection
+        options['poolclass'] = StaticPool
+        options['connect_args'] = {'check_same_thread': False}
+        return options
+    options['pool_size'] = int(os.getenv('USER_AUTH_DB_POOL_SIZE', '5'))
+    options['max_overflow'] = int(
+        os.getenv('USER_AUTH_DB_MAX_OVERFLOW', '10'))
+    options['pool_timeout'] = float(
+        os.getenv('USER_AUTH_DB_POOL_TIMEOUT', '30'))
+    options['pool_recycle'] = int(
+        os.getenv('USER_AUTH_DB_POOL_RECYCLE', '-1'))
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Puts every new SQLite connection in WAL mode, so readers no longer
+    block the writer, and makes it wait USER_AUTH_DB_BUSY_TIMEOUT
+    milliseconds for a lock instead of failing with "database is locked".
+
+    Args:
+        dbapi_connection: The new DBAPI connection.
+        connection_record: The pool record of the connection.
+    """
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout={:d}".format(
+        int(os.getenv('USER_AUTH_DB_BUSY_TIMEOUT', '5000'))))
+    cursor.close()
+
+
 class DB:
     """
     DB class for interacting with the database.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, url: str = None, reset: bool = None) -> None:
         """
-        Initialize a new DB instance and create the necessary tables.
+        Initialize a new DB instance, creating the tables and indexes the
+        database is missing and keeping the users it already holds.
+
+        Args:
+            url (str): The database URL, USER_AUTH_DB_URL or
+            sqlite:///a.db by default.
+            reset (bool): Whether to drop every table first, e.g. in
+            tests; USER_AUTH_DB_RESET=1 by default.
         """
 
-        self._engine = create_engine("sqlite:///a.db", echo=False)
-        Base.metadata.drop_all(self._engine)  # Drop existing tables
-        Base.metadata.create_all(self._engine)  # Create new tables
-        self.__session = None
+        url = url or os.getenv('USER_AUTH_DB_URL', DEFAULT_URL)
+        if reset is None:
+            reset = os.getenv('USER_AUTH_DB_RESET', '0') == '1'
+        self._engine = create_engine(url, **_engine_options(url))
+        if self._engine.dialect.name == 'sqlite':
+            event.listen(self._engine, 'connect', _set_sqlite_pragmas)
+        if reset:
+            Base.metadata.drop_all(self._engine)
+            _MIGRATED.discard(url)
+        if url not in _MIGRATED or _in_memory(url):
+            self.migrate()
+            _MIGRATED.add(url)
+        self.__session = scoped_session(sessionmaker(bind=self._engine))
+
+    def migrate(self) -> None:
+        """
+        Brings an existing database up to the current schema, without
+        dropping any data: creates the tables and indexes it is missing.
+
+        Raises:
+            IntegrityError: If existing rows break a unique index, e.g.
+            duplicate emails.
+        """
+
+        inspector = inspect(self._engine)
+        existing_tables = set(inspector.get_table_names())
+        missing = [table for table in Base.metadata.sorted_tables
+                   if table.name not in existing_tables]
+        if missing:
+            Base.metadata.create_all(self._engine, tables=missing,
+                                     checkfirst=False)
+        for table in Base.metadata.sorted_tables:
+            if table in missing:
+                continue
+            existing = {index['name']
+                        for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=self._engine)
 
     @property
     def _session(self) -> Session:
         """
-        Memoized session object for database operations.
+        Session object for database operations, one per thread.
+        """
+
+        return self.__session()
+
+    def remove_session(self) -> None:
+        """
+        Closes the calling thread's session and returns its connection to
+        the pool; the next operation in the thread starts a new one.
         """
 
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        self.__session.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """
@@ -74,16 +246,11 @@ class DB:
             NoResultFound: If no user is found matching the filters.
         """
 
-        fields, values = [], []
-        for key, value in kwargs.items():
-            if hasattr(User, key):
-                fields.append(getattr(User, key))
-                values.append(value)
-            else:
-                raise InvalidRequestError()
-        result = self._session.query(User).filter(
-            tuple_(*fields).in_([tuple(values)])
-        ).first()
+        if not kwargs or not COLUMNS.issuperset(kwargs):
+            raise InvalidRequestError()
+        statement = _find_statement(tuple(sorted(kwargs)))
+        params = {'f_' + key: value for key, value in kwargs.items()}
+        result = self._session.scalars(statement, params).first()
         if result is None:
             raise NoResultFound()
         return result
@@ -98,19 +265,68 @@ class DB:
 
         Raises:
             ValueError: If an invalid field is provided.
+            NoResultFound: If no user has this id.
         """
 
-        user = self.find_user_by(id=user_id)
-        if user is None:
+        if not kwargs:
+            self.find_user_by(id=user_id)
             return
-        update_source = {}
-        for key, value in kwargs.items():
-            if hasattr(User, key):
-                update_source[getattr(User, key)] = value
-            else:
-                raise ValueError()
-        self._session.query(User).filter(User.id == user_id).update(
-            update_source,
-            synchronize_session=False,
+        if not self.update_users_where({'id': user_id}, **kwargs):
+            raise NoResultFound()
+
+    def update_users_where(self, where: dict,
+                           returning: Optional[Tuple[str, ...]] = None,
+                           **kwargs) -> Union[int, Optional[tuple]]:
+        """
+        Updates, in a single UPDATE statement, the users whose columns
+        equal the values in `where`.
+
+        Args:
+            where (dict): The column values the updated users must have.
+            returning (Tuple[str, ...]): Columns to read back from the
+            first updated row, through RETURNING.
+            **kwargs: Keyword arguments representing the fields to update.
+
+        Returns:
+            Union[int, Optional[tuple]]: The number of updated rows, or
+            the `returning` columns of the first one (None if no user
+            matched) when `returning` is given.
+
+        Raises:
+            ValueError: If an invalid field, filter or returned column is
+            provided, or no filter is.
+        """
+
+        returning = tuple(returning or ())
+        if not where or not COLUMNS.issuperset(where) or \
+                not COLUMNS.issuperset(kwargs) or \
+                not COLUMNS.issuperset(returning):
+            raise ValueError()
+        if not kwargs:
+            return None if returning else 0
+        params = {'v_' + key: value for key, value in kwargs.items()}
+        params.update(('w_' + key, value) for key, value in where.items())
+        statement = _update_statement(
+            tuple(sorted(where)), tuple(sorted(kwargs)), returning)
+        result = self._session.execute(
+            statement, params,
+            execution_options={'synchronize_session': False},
         )
+        outcome = result.first() if returning else result.rowcount
         self._session.commit()
+        return tuple(outcome) if returning and outcome else outcome
+
+    def iter_hashed_passwords(self, batch_size: int = 1000) -> Iterator[bytes]:
+        """
+        Iterates over the hashed password of every user.
+
+        Args:
+            batch_size (int): The number of rows fetched at a time.
+
+        Returns:
+            Iterator[bytes]: The stored password hashes.
+        """
+
+        query = self._session.query(User.hashed_password)
+        for (hashed_password,) in query.yield_per(batch_size):
+            yield hashed_password
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Concurrent login load test: threads run login, GET /profile and logout
+against the app served by a threaded server, on a throwaway database
+"""
+
+import argparse
+import http.client
+import os
+import tempfile
+import threading
+import time
+from typing import List
+from urllib.parse import urlencode
+
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def flow(port: int, email: str, password: str) -> bool:
+    """
+    Logs a user in, reads its profile and logs it out.
+
+    Args:
+        port (int): The port the app listens on.
+        email (str): The email of the user.
+        password (str): The password of the user.
+
+    Returns:
+        bool: True if the three requests got the expected status.
+    """
+
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    try:
+        connection.request('POST', '/sessions', urlencode(
+            {'email': email, 'password': password}), FORM)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            return False
+        cookie = {'Cookie': response.getheader('Set-Cookie').split(';')[0]}
+
+        connection.request('GET', '/profile', headers=cookie)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            return False
+
+        connection.request('DELETE', '/sessions', headers=cookie)
+        response = connection.getresponse()
+        response.read()
+        return response.status == 302
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    """
+    Reads a percentile of sorted latencies.
+
+    Args:
+        latencies (List[float]): The sorted latencies, in seconds.
+        fraction (float): The percentile, between 0 and 1.
+
+    Returns:
+        float: The latency at that percentile, in milliseconds.
+    """
+
+    index = min(int(len(latencies) * fraction), len(latencies) - 1)
+    return latencies[index] * 1000
+
+
+def main() -> None:
+    """
+    Registers one user per thread, runs the flows and prints how many
+    succeeded, the throughput and the latency percentiles.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16,
+                        help="concurrent clients, one user each")
+    parser.add_argument('--flows', type=int, default=10,
+                        help="login/profile/logout flows per thread")
+    parser.add_argument('--rounds', type=int, default=None,
+                        help="bcrypt work factor, calibrated by default")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ.setdefault('USER_AUTH_DB_URL', 'sqlite:///{}'.format(
+        os.path.join(directory, 'load_test.db')))
+    os.environ['USER_AUTH_DB_RESET'] = '1'
+    if args.rounds is not None:
+        os.environ['USER_AUTH_BCRYPT_ROUNDS'] = str(args.rounds)
+
+    from app import app, AUTH
+    from werkzeug.serving import make_server
+
+    users = ['user{}@load.test'.format(i) for i in range(args.threads)]
+    for email in users:
+        AUTH.register_user(email, 'password')
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    lock = threading.Lock()
+    latencies = []
+    failures = []
+
+    def client(email: str) -> None:
+        for _ in range(args.flows):
+            start = time.perf_counter()
+            good = flow(server.server_port, email, 'password')
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                if not good:
+                    failures.append(email)
+
+    threads = [threading.Thread(target=client, args=(email,))
+               for email in users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    latencies.sort()
+    print("{} flows: {} ok, {} failed, {:.1f} flows/s, p50 {:.0f} ms, "
+          "p95 {:.0f} ms".format(
+              len(latencies), len(latencies) - len(failures),
+              len(failures), len(latencies) / elapsed,
+              percentile(latencies, 0.5), percentile(latencies, 0.95)))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ User module
 """
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String, text
 
 
 Base = declarative_base()
@@ -14,6 +14,13 @@ class User(Base):
     """ User class """
 
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_email', 'email', unique=True),
+        Index('ix_users_session_id', 'session_id', unique=True),
+        Index('ix_users_reset_token', 'reset_token',
+              sqlite_where=text('reset_token IS NOT NULL'),
+              postgresql_where=text('reset_token IS NOT NULL')),
+    )
     id = Column(Integer, primary_key=True)
     email = Column(String(250), nullable=False)
     hashed_password = Column(String(250), nullable=False)